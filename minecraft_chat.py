@@ -1,94 +1,192 @@
 # minecraft_chat.py
-import websocket
+import asyncio
 import json
+import logging
+import random
 import threading
-import time
+
+import websockets
+
+log = logging.getLogger(__name__)
+
+# All clients multiplex onto one event loop in one daemon thread, so running
+# many room clients costs O(1) threads instead of a thread stack per client
+_shared_loop = None
+_shared_loop_lock = threading.Lock()
+
+
+def _get_shared_loop():
+    """Return the shared event loop, starting its thread on first use"""
+    global _shared_loop
+    with _shared_loop_lock:
+        if _shared_loop is None:
+            _shared_loop = asyncio.new_event_loop()
+            thread = threading.Thread(target=_shared_loop.run_forever)
+            thread.daemon = True
+            thread.start()
+        return _shared_loop
+
+# orjson is a C implementation that is several times faster than stdlib json
+# and accepts/produces bytes directly, skipping str<->bytes round-trips on
+# every frame. Fall back to stdlib json when it isn't installed.
+try:
+    import orjson
+
+    _json_loads = orjson.loads
+    _json_dumps = orjson.dumps
+except ImportError:
+    _json_loads = json.loads
+
+    def _json_dumps(obj):
+        return json.dumps(obj, separators=(",", ":")).encode("utf-8")
 
 
 class MinecraftChatClient:
+    # Pre-serialized envelope for untargeted chat messages so the hot send
+    # path only JSON-encodes the message string itself
+    _CHAT_PREFIX = b'{"type":"chat_message","message":'
+    _CHAT_SUFFIX = b"}"
+
     def __init__(self, server_url="ws://localhost:8080/chat"):
         self.server_url = server_url
         self.ws = None
         self.connected = False
-        self._chat_callback = None
+        self._chat_callbacks = []
         self._connection_callback = None
         self._reconnect_attempts = 0
-        self._max_reconnect_attempts = 5
-        self._reconnect_delay = 2  # seconds
+        self._max_reconnect_attempts = 20
+        self._base_delay = 0.2  # seconds
+        self._max_delay = 30  # seconds
         self._running = False
+        self._open_event = threading.Event()
+        self._settled_event = threading.Event()
+        self._loop = None
+        self._run_future = None
         super().__init__()
 
-    def connect(self, auto_reconnect=True):
-        """Connect to the chat server with optional auto-reconnect"""
+    def connect(self, auto_reconnect=True, timeout=5):
+        """Connect to the chat server with optional auto-reconnect
+
+        Blocks until the connection is open or `timeout` seconds elapse,
+        then returns the connection state. Reconnects keep running in the
+        background either way.
+        """
         self._running = True
         self._reconnect_attempts = 0
-        self._try_connect(auto_reconnect)
-
-    def _try_connect(self, auto_reconnect=True):
-        """Internal method to establish connection"""
-        if self.ws:
-            self.ws.close()
-
-        self.ws = websocket.WebSocketApp(
-            self.server_url,
-            on_message=self._on_message,
-            on_error=self._on_error,
-            on_close=self._on_close,
-            on_open=self._on_open,
+        self._open_event.clear()
+        self._settled_event.clear()
+        self._loop = _get_shared_loop()
+        self._run_future = asyncio.run_coroutine_threadsafe(
+            self._run(auto_reconnect), self._loop
         )
+        # Wait until the outcome is settled rather than sleeping a fixed
+        # interval: a successful open returns immediately, and so does a
+        # fast failure (e.g. ECONNREFUSED) once no reconnect is pending
+        self._settled_event.wait(timeout)
+        return self.connected
 
-        wst = threading.Thread(target=self.ws.run_forever)
-        wst.daemon = True
-        wst.start()
+    async def _run(self, auto_reconnect=True):
+        """Connect and pump inbound messages, reconnecting as needed"""
+        try:
+            await self._run_loop(auto_reconnect)
+        finally:
+            # Giving up (or being cancelled) settles the outcome just as
+            # much as a successful open does; unblock any waiting connect()
+            self._settled_event.set()
 
-        # Wait briefly to check if connection succeeds
-        time.sleep(1)
+    async def _run_loop(self, auto_reconnect=True):
+        while self._running:
+            try:
+                # Keepalive is the library's job; compression is disabled
+                # because chat frames are small JSON where permessage-deflate
+                # costs more CPU per frame than the bytes it saves
+                async with websockets.connect(
+                    self.server_url,
+                    ping_interval=30,
+                    ping_timeout=10,
+                    open_timeout=10,
+                    compression=None,
+                ) as ws:
+                    self.ws = ws
+                    self._on_open()
+                    async for message in ws:
+                        self._on_message(message)
+            except Exception as e:
+                log.warning("WebSocket error: %s", e)
+            finally:
+                self.ws = None
+                self._on_close()
 
-        # If auto-reconnect is enabled and we're not connected, try again
-        if auto_reconnect and not self.connected and self._running:
-            self._handle_reconnect()
+            if not (auto_reconnect and self._running):
+                break
+            if not await self._handle_reconnect():
+                break
 
-    def _handle_reconnect(self):
+    async def _handle_reconnect(self):
         """Handle reconnection logic"""
         if self._reconnect_attempts >= self._max_reconnect_attempts:
-            print(f"Failed to connect after {self._reconnect_attempts} attempts")
+            log.error("Failed to connect after %d attempts", self._reconnect_attempts)
             self._running = False
-            return
+            return False
 
         self._reconnect_attempts += 1
-        delay = self._reconnect_delay * self._reconnect_attempts
-        print(f"Reconnecting in {delay} seconds (attempt {self._reconnect_attempts})")
-        time.sleep(delay)
-
-        if self._running:
-            self._try_connect(True)
+        # Exponential backoff with jitter: fast first retry, gentle on the
+        # server when many clients reconnect after a restart
+        delay = min(
+            self._max_delay, self._base_delay * (2 ** (self._reconnect_attempts - 1))
+        ) * (0.5 + random.random())
+        log.info("Reconnecting in %.1f seconds (attempt %d)", delay, self._reconnect_attempts)
+        await asyncio.sleep(delay)
+        return self._running
 
     def disconnect(self):
         """Disconnect from the chat server"""
         self._running = False
-        if self.ws:
-            self.ws.close()
+        if self.ws and self._loop:
+            asyncio.run_coroutine_threadsafe(self.ws.close(), self._loop)
+        if self._run_future:
+            self._run_future.cancel()
         self.connected = False
 
     def send_chat_message(self, message, target=None):
-        """Send a chat message to the Minecraft server"""
+        """Send a chat message to the Minecraft server
+
+        Payloads are pre-encoded to bytes and go out as binary frames,
+        skipping the text-frame UTF-8 validation pass; the Go server reads
+        JSON from text and binary frames alike.
+        """
         if not self.connected:
             raise ConnectionError("Not connected to chat server")
 
-        payload = {"type": "chat_message", "message": message}
         if target:
-            payload["target"] = target
+            payload = _json_dumps(
+                {"type": "chat_message", "message": message, "target": target}
+            )
+        else:
+            payload = self._CHAT_PREFIX + _json_dumps(message) + self._CHAT_SUFFIX
 
-        if not self.ws:
+        ws = self.ws
+        if not ws:
             raise ConnectionError("Not connected to chat server")
-        self.ws.send(json.dumps(payload))
+        future = asyncio.run_coroutine_threadsafe(ws.send(payload), self._loop)
+
+        # Callbacks run on the event-loop thread; blocking on the future
+        # there would deadlock the loop (and every client sharing it), so
+        # only wait for completion when called from another thread
+        try:
+            on_loop_thread = asyncio.get_running_loop() is self._loop
+        except RuntimeError:
+            on_loop_thread = False
+        if not on_loop_thread:
+            future.result()
 
     def register_chat_callback(self, callback):
         """Register a function to be called when a chat message is received
 
-        The callback should accept (sender, message) parameters
+        The callback should accept (sender, message) parameters. May be
+        called multiple times to register several subscribers.
         """
-        self._chat_callback = callback
+        self._chat_callbacks.append(callback)
 
     def register_connection_callback(self, callback):
         """Register a function to be called when connection state changes
@@ -102,34 +200,66 @@ class MinecraftChatClient:
             callback(True)
 
     # Internal event handlers
-    def _on_message(self, ws, message):
+    def _on_message(self, message):
+        # Don't pay for the parse when nobody is listening
+        if not self._chat_callbacks:
+            return
+
+        # Cheap substring sniff over the frame head: chat is the only type
+        # we handle, so presence pings / heartbeats are dropped without ever
+        # allocating a parsed dict (the parse below still decides for real)
+        if isinstance(message, (bytes, bytearray)):
+            if b'"chat_message"' not in message[:128]:
+                return
+        elif '"chat_message"' not in message[:128]:
+            return
+
+        # Only the parse can reasonably fail; malformed or non-chat frames
+        # are handled with .get checks rather than exception control flow
+        # (orjson.JSONDecodeError subclasses ValueError, as does stdlib's)
         try:
-            data = json.loads(message)
-            if data["type"] == "chat_message" and self._chat_callback:
-                self._chat_callback(data["sender"], data["message"])
-        except Exception as e:
-            print(f"Error processing message: {e}")
+            data = _json_loads(message)
+        except ValueError:
+            # debug level so a flood of malformed frames doesn't serialize
+            # the read loop on log I/O unless someone opted in
+            log.debug("Dropping malformed frame", exc_info=True)
+            return
+
+        # The sniff can match inside any JSON value, so the frame may parse
+        # to something other than an object
+        if not isinstance(data, dict) or data.get("type") != "chat_message":
+            return
+        sender = data.get("sender")
+        text = data.get("message")
+        if sender is None or text is None:
+            return
 
-    def _on_error(self, ws, error):
-        print(f"WebSocket error: {error}")
+        # Parse once, dispatch the parsed fields to every subscriber. A
+        # failing callback must not look like a transport error to _run,
+        # which would tear down the connection and trigger reconnects
+        for callback in self._chat_callbacks:
+            try:
+                callback(sender, text)
+            except Exception:
+                log.exception("Chat callback %r raised", callback)
 
-    def _on_close(self, ws, close_status_code, close_msg):
+    def _on_close(self):
         was_connected = self.connected
         self.connected = False
+        self._open_event.clear()
 
         if was_connected and self._connection_callback:
             self._connection_callback(False)
 
-        print(f"Connection closed: {close_status_code} - {close_msg}")
-
-        # Try to reconnect if we're still supposed to be running
-        if self._running:
-            self._handle_reconnect()
+        if was_connected:
+            log.info("Connection closed")
 
-    def _on_open(self, ws):
+    def _on_open(self):
         self.connected = True
         self._reconnect_attempts = 0
-        print("Connection established")
+        self._open_event.set()
+        self._settled_event.set()
+        log.info("Connection established")
 
         if self._connection_callback:
             self._connection_callback(True)
@@ -0,0 +1,451 @@
+# xbl3_core.py
+"""Shared Microsoft / Xbox Live authentication core.
+
+Both the xbl3 library module and the xbl3cli entrypoint import from here,
+so there is a single copy of the MSAL token management and the XBL/XSTS
+exchange flow. Debug output is opt-in (set the XBL3_DEBUG environment
+variable, or flip the module-level DEBUG flag like the CLI does) so
+library users don't pay for stderr chatter.
+"""
+
+import atexit
+import os
+import json
+import sys
+import time
+
+import requests
+from urllib3.util.retry import Retry
+import msal
+
+# orjson speeds up cache (de)serialization when available; fall back to
+# stdlib json otherwise
+try:
+    import orjson
+
+    _json_loads = orjson.loads
+    _json_dumps = orjson.dumps
+except ImportError:
+    orjson = None
+    _json_loads = json.loads
+
+    def _json_dumps(obj):
+        return json.dumps(obj, separators=(",", ":")).encode("utf-8")
+
+# httpx is optional: with http2=True the XBL/XSTS exchanges can share one
+# HTTP/2 connection and benefit from HPACK header compression. Without it
+# the pooled requests.Session below is used instead. h2 is required too —
+# httpx.Client(http2=True) raises unless the httpx[http2] extra is installed.
+try:
+    import httpx
+    import h2  # noqa: F401
+
+    _http_errors = (httpx.HTTPError,)
+except ImportError:
+    httpx = None
+    _http_errors = (requests.RequestException,)
+
+DEBUG = bool(os.environ.get("XBL3_DEBUG"))
+
+
+def debug_print(*args, **kwargs):
+    """Print diagnostics to stderr when debug output is enabled"""
+    if DEBUG:
+        print(*args, file=sys.stderr, **kwargs)
+
+
+def get_cache_location():
+    """Pick a writable location for the MSAL token cache file"""
+    # Try using standard location first
+    try:
+        cache_dir = os.getenv("XDG_RUNTIME_DIR", None)
+        if cache_dir and os.path.exists(cache_dir) and os.access(cache_dir, os.W_OK):
+            return os.path.join(cache_dir, "xbl3_token_cache.bin")
+    except Exception as e:
+        debug_print(f"{e.__class__.__name__}: {e}")
+
+    # Try app directory if available
+    try:
+        app_dir = os.path.dirname(os.path.abspath(__file__))
+        if os.access(app_dir, os.W_OK):
+            return os.path.join(app_dir, "xbl3_token_cache.bin")
+    except Exception as e:
+        debug_print(f"{e.__class__.__name__}: {e}")
+
+    # Fall back to temp directory
+    try:
+        import tempfile
+
+        temp_dir = tempfile.gettempdir()
+        if os.access(temp_dir, os.W_OK):
+            return os.path.join(temp_dir, "xbl3_token_cache.bin")
+    except Exception as e:
+        debug_print(f"{e.__class__.__name__}: {e}")
+
+    # If all else fails, use in-memory cache only (no persistence)
+    return None
+
+
+def _atomic_write(path, data):
+    """Write bytes to a file atomically so a crash can't corrupt the cache"""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class FastTokenCache(msal.SerializableTokenCache):
+    """SerializableTokenCache that (de)serializes with orjson when available"""
+
+    def serialize(self):
+        if orjson is None:
+            return super().serialize()
+        with self._lock:
+            self.has_state_changed = False
+            return orjson.dumps(self._cache, option=orjson.OPT_INDENT_2).decode()
+
+    def deserialize(self, state):
+        if orjson is None:
+            return super().deserialize(state)
+        with self._lock:
+            self.has_state_changed = False
+            self._cache = orjson.loads(state) if state else {}
+
+
+class CacheManager:
+    """Handles caching of access tokens to prevent redundant authentication"""
+
+    CACHE_FILE = "xbl_token_cache.json"
+
+    def __init__(self):
+        self._cache_dict = None
+        self._dirty = False
+        atexit.register(self._flush)
+
+    def get_cached(self):
+        """Retrieve cached tokens, reading the file only once"""
+        if self._cache_dict is None:
+            if os.path.exists(self.CACHE_FILE):
+                with open(self.CACHE_FILE, "rb") as f:
+                    self._cache_dict = _json_loads(f.read())
+            else:
+                self._cache_dict = {}
+        return self._cache_dict
+
+    def set_cached_partial(self, data):
+        """Update the in-memory token cache; flushed to disk at exit"""
+        self.get_cached().update(data)
+        self._dirty = True
+
+    def _flush(self):
+        """Write the cache to disk if it has changed"""
+        if not self._dirty:
+            return
+        _atomic_write(self.CACHE_FILE, _json_dumps(self._cache_dict))
+        self._dirty = False
+
+
+class MsaTokenManager:
+    """Handles Microsoft authentication and token management using MSAL"""
+
+    CLIENT_ID = "93819583-abf7-4a5e-8b53-9526cf7e7ba9"
+    AUTHORITY = "https://login.microsoftonline.com/consumers/"
+    SCOPES = ["Xboxlive.signin", "Xboxlive.offline_access"]
+
+    def __init__(self, cache_filename=None):
+        self.cache = CacheManager()
+        self.cache_filename = cache_filename or get_cache_location()
+        debug_print(f"Token cache location: {self.cache_filename or 'In-memory only (no persistence)'}")
+
+        # Initialize the serializable token cache
+        self.token_cache = FastTokenCache()
+        if self.cache_filename and os.path.exists(self.cache_filename):
+            try:
+                with open(self.cache_filename, "r") as f:
+                    self.token_cache.deserialize(f.read())
+                debug_print("Loaded token cache from file")
+            except Exception as e:
+                debug_print(f"Failed to load token cache: {e}")
+                debug_print("Starting with fresh token cache")
+
+        # Register to save cache on exit
+        atexit.register(self._save_cache)
+
+        # Initialize MSAL app with our token cache
+        self.msal_app = msal.PublicClientApplication(
+            self.CLIENT_ID,
+            authority=self.AUTHORITY,
+            token_cache=self.token_cache,
+        )
+
+    def _save_cache(self):
+        """Save the token cache to disk if it has changed"""
+        if self.token_cache.has_state_changed and self.cache_filename:
+            try:
+                os.makedirs(os.path.dirname(self.cache_filename), exist_ok=True)
+                _atomic_write(self.cache_filename, self.token_cache.serialize().encode("utf-8"))
+                debug_print("Token cache saved to file")
+            except Exception as e:
+                debug_print(f"Failed to save token cache: {e}")
+                debug_print("Continuing with in-memory cache only")
+
+    def get_access_token(self):
+        """Returns a valid access token, refreshing if necessary"""
+        # MSAL handles expiry checks and refresh-token rotation internally,
+        # including its 5-minute proactive refresh window
+        accounts = self.msal_app.get_accounts()
+        if accounts:
+            result = self.msal_app.acquire_token_silent(
+                self.SCOPES, account=accounts[0]
+            )
+            if result and "access_token" in result:
+                debug_print("Retrieved token from cache")
+                return {"valid": True, "token": result["access_token"]}
+
+        # If no valid token in cache, try to refresh or prompt for new auth
+        return self.refresh_tokens()
+
+    def refresh_tokens(self):
+        """Attempt to refresh the token or initiate a new auth flow"""
+        accounts = self.msal_app.get_accounts()
+        if accounts:
+            debug_print(f"Found {len(accounts)} account(s) in cache, attempting silent token refresh")
+            result = self.msal_app.acquire_token_silent(
+                self.SCOPES, account=accounts[0]
+            )
+            if result and "access_token" in result:
+                debug_print("Token refreshed successfully")
+                return {"valid": True, "token": result["access_token"]}
+
+            debug_print("Silent token refresh failed, initiating new auth flow")
+
+        # If we couldn't refresh silently, initiate device code flow
+        return self.auth_device_code()
+
+    def auth_device_code(self):
+        """Authenticate using the device code flow"""
+        debug_print("Starting device code authentication flow")
+        flow = self.msal_app.initiate_device_flow(scopes=self.SCOPES)
+
+        if "user_code" not in flow:
+            debug_print(f"Failed to initiate device flow: {flow.get('error_description', 'Unknown error')}")
+            return {"valid": False, "error": "Failed to initiate device flow"}
+
+        # Print instructions for user authentication; always shown since the
+        # user can't complete the flow without them
+        print("\n" + "*" * 70, file=sys.stderr)
+        print(flow["message"], file=sys.stderr)
+        print("*" * 70 + "\n", file=sys.stderr)
+
+        # Wait for the user to complete the authentication
+        result = self.msal_app.acquire_token_by_device_flow(flow)
+
+        if "access_token" not in result:
+            debug_print(f"Authentication failed: {result.get('error_description', 'Unknown error')}")
+            return {"valid": False, "error": result.get("error_description", "Unknown error")}
+
+        debug_print("Authentication successful")
+        return {"valid": True, "token": result["access_token"]}
+
+
+class XboxLiveAuth:
+    """Handles Xbox Live and XSTS authentication"""
+
+    XBL_AUTH_URL = "https://user.auth.xboxlive.com/user/authenticate"
+    XSTS_AUTH_URL = "https://xsts.auth.xboxlive.com/xsts/authorize"
+
+    XBL3_TTL = 82800  # 23 hrs validity
+    REFRESH_MARGIN = 300  # refresh 5 min early
+
+    def __init__(self, msa_manager):
+        self.msa_manager = msa_manager
+        # Memoized XBL3.0 string; monotonic expiry avoids wallclock skew
+        self._xbl3_cached = None
+        self._xbl3_expiry = 0.0
+        # Pool connections so the XBL -> XSTS sequence (and later refreshes)
+        # reuse sockets instead of paying a TLS handshake per request
+        if httpx is not None:
+            self.session = httpx.Client(
+                http2=True, timeout=httpx.Timeout(10.0, connect=3.0)
+            )
+            self.session.headers["Content-Type"] = "application/json"
+            self._post_timeout = httpx.Timeout(10.0, connect=3.0)
+        else:
+            self.session = requests.Session()
+            self.session.headers["Content-Type"] = "application/json"
+            adapter = requests.adapters.HTTPAdapter(
+                pool_connections=2,
+                pool_maxsize=4,
+                max_retries=Retry(
+                    total=3,
+                    backoff_factor=0.5,
+                    status_forcelist=[429, 500, 502, 503, 504],
+                ),
+            )
+            self.session.mount("https://", adapter)
+            self._post_timeout = (3.05, 10)
+
+    def get_xbl3_token(self):
+        """Fetches or refreshes an XBL3.0 token"""
+        # Serve the in-process copy while it is comfortably valid
+        if self._xbl3_cached and time.monotonic() < self._xbl3_expiry - self.REFRESH_MARGIN:
+            return self._xbl3_cached
+
+        # expires_on is a Unix timestamp; compare floats directly
+        token_data = self.msa_manager.cache.get_cached().get("XBL3Token", {})
+        if token_data and token_data["expires_on"] - self.REFRESH_MARGIN > time.time():
+            self._xbl3_cached = token_data["token"]
+            self._xbl3_expiry = time.monotonic() + (token_data["expires_on"] - time.time())
+            return self._xbl3_cached
+
+        debug_print("Fetching new XBL3.0 token...")
+        return self.authenticate()
+
+    def authenticate(self):
+        """Perform full authentication flow from MSA to XBL3.0 token"""
+        # Step 1: Get Microsoft access token
+        msa_token_result = self.msa_manager.get_access_token()
+        if not msa_token_result["valid"]:
+            debug_print(f"Failed to get MSA token: {msa_token_result.get('error', 'Unknown error')}")
+            return None
+
+        msa_token = msa_token_result["token"]
+        debug_print("Successfully obtained MSA token")
+
+        # Step 2: Get Xbox Live token
+        xbl_token = self.get_xbl_token(msa_token)
+        if not xbl_token:
+            debug_print("Failed to get XBL token")
+            return None
+        debug_print("Successfully obtained XBL token")
+
+        # Step 3: Get Minecraft-specific XSTS token (most important for Minecraft authentication)
+        xsts_token = self.get_minecraft_xsts_token(xbl_token)
+        if xsts_token:
+            debug_print("Successfully obtained Minecraft-specific XSTS token")
+        else:
+            debug_print("Failed to get Minecraft-specific XSTS token")
+            # Step 4: As a fallback, get the general XSTS token
+            xsts_token = self.get_xsts_token(xbl_token)
+            if not xsts_token:
+                debug_print("Failed to get XSTS token")
+                return None
+            debug_print("Successfully obtained general XSTS token")
+
+        # Format the final XBL3.0 token
+        uhs = xsts_token["DisplayClaims"]["xui"][0]["uhs"]
+        token = xsts_token["Token"]
+        xbl3_token = f"XBL3.0 x={uhs};{token}"
+        debug_print(f"XBL3.0 token generated successfully (UHS: {uhs})")
+
+        # Persist and memoize so later calls skip the network entirely
+        self.msa_manager.cache.set_cached_partial(
+            {"XBL3Token": {"token": xbl3_token, "expires_on": time.time() + self.XBL3_TTL}}
+        )
+        self._xbl3_cached = xbl3_token
+        self._xbl3_expiry = time.monotonic() + self.XBL3_TTL
+        return xbl3_token
+
+    def _post_auth_request(self, url, payload):
+        """POST a token exchange payload and return the parsed response"""
+        response = self.session.post(
+            url,
+            json=payload,
+            headers={"Accept": "application/json"},
+            timeout=self._post_timeout,
+        )
+        response.raise_for_status()
+        return response.json()
+
+    def get_xbl_token(self, msa_token):
+        """Exchange MSA token for Xbox Live token"""
+        data = None
+        try:
+            # The format of this payload is critical
+            payload = {
+                "Properties": {
+                    "AuthMethod": "RPS",
+                    "SiteName": "user.auth.xboxlive.com",
+                    "RpsTicket": f"d={msa_token}"
+                },
+                "RelyingParty": "http://auth.xboxlive.com",
+                "TokenType": "JWT"
+            }
+
+            data = self._post_auth_request(self.XBL_AUTH_URL, payload)
+            debug_print(f"XBL token response format: {list(data.keys())}")
+
+            # Validate the response has the expected fields
+            if "Token" not in data or "DisplayClaims" not in data:
+                debug_print(f"Missing required fields in XBL token response: {data}")
+                return None
+
+            if "xui" not in data["DisplayClaims"] or not data["DisplayClaims"]["xui"]:
+                debug_print(f"Missing xui claims in XBL token response: {data['DisplayClaims']}")
+                return None
+
+            return data
+        except _http_errors as e:
+            debug_print(f"Request failed during XBL token acquisition: {e}")
+            return None
+        except Exception as e:
+            debug_print(f"Unexpected error during XBL token acquisition: {e}")
+            debug_print(f"Response data: {data}")
+            return None
+
+    def get_xsts_token(self, xbl_token):
+        """Exchange Xbox Live token for XSTS token"""
+        data = None
+        try:
+            payload = {
+                "Properties": {
+                    "SandboxId": "RETAIL",
+                    "UserTokens": [xbl_token["Token"]]
+                },
+                "RelyingParty": "http://xboxlive.com",
+                "TokenType": "JWT"
+            }
+
+            data = self._post_auth_request(self.XSTS_AUTH_URL, payload)
+            debug_print(f"XSTS token response format: {list(data.keys())}")
+
+            return data
+        except _http_errors as e:
+            debug_print(f"Request failed during XSTS token acquisition: {e}")
+            return None
+        except Exception as e:
+            debug_print(f"Unexpected error during XSTS token acquisition: {e}")
+            debug_print(f"Response data: {data}")
+            return None
+
+    def get_minecraft_xsts_token(self, xbl_token):
+        """Exchange Xbox Live token for Minecraft-specific XSTS token"""
+        data = None
+        try:
+            payload = {
+                "Properties": {
+                    "SandboxId": "RETAIL",
+                    "UserTokens": [xbl_token["Token"]]
+                },
+                # This specific URL format is critical for Minecraft authentication
+                "RelyingParty": "rp://api.minecraftservices.com/",
+                "TokenType": "JWT"
+            }
+
+            data = self._post_auth_request(self.XSTS_AUTH_URL, payload)
+            debug_print(f"Minecraft XSTS token response format: {list(data.keys())}")
+
+            if "Token" not in data:
+                debug_print(f"No Token in response. Full response: {data}")
+                return None
+
+            return data
+        except _http_errors as e:
+            debug_print(f"Request failed during Minecraft XSTS token acquisition: {e}")
+            return None
+        except Exception as e:
+            debug_print(f"Unexpected error during Minecraft XSTS token acquisition: {e}")
+            debug_print(f"Response data: {data}")
+            return None